@@ -5,7 +5,7 @@ Please see the LICENSE file for the terms and conditions
 associated with this software.
 '''
 import asyncio
-from asyncio.queues import Queue
+from collections import deque
 from multiprocessing import Pipe, Process
 from contextlib import asynccontextmanager
 
@@ -24,7 +24,9 @@ class BackendQueue:
             self.worker = Process(target=BackendQueue.worker, args=(self.writer,), daemon=True)
             self.worker.start()
         else:
-            self.queue = Queue()
+            # single producer/single consumer, so a deque plus a future to wake the writer is sufficient
+            self.queue = deque()
+            self._waiter = None
             self.worker = loop.create_task(self.writer())
         self.started = True
 
@@ -33,7 +35,8 @@ class BackendQueue:
             self.queue[1].send(SHUTDOWN_SENTINEL)
             self.worker.join()
         else:
-            await self.queue.put(SHUTDOWN_SENTINEL)
+            self.queue.append(SHUTDOWN_SENTINEL)
+            self._wakeup()
         self.running = False
 
     @staticmethod
@@ -47,11 +50,16 @@ class BackendQueue:
     async def writer(self):
         raise NotImplementedError
 
+    def _wakeup(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
     async def write(self, data):
         if self.multiprocess:
             self.queue[1].send(data)
         else:
-            await self.queue.put(data)
+            self.queue.append(data)
+            self._wakeup()
 
     @asynccontextmanager
     async def read_queue(self) -> list:
@@ -63,29 +71,21 @@ class BackendQueue:
             else:
                 yield [msg]
         else:
-            current_depth = self.queue.qsize()
-            if current_depth == 0:
-                update = await self.queue.get()
+            if not self.queue:
+                self._waiter = asyncio.get_running_loop().create_future()
+                try:
+                    await self._waiter
+                finally:
+                    self._waiter = None
+            ret = []
+            while self.queue:
+                update = self.queue.popleft()
                 if update == SHUTDOWN_SENTINEL:
-                    yield []
-                else:
-                    yield [update]
-                self.queue.task_done()
-            else:
-                ret = []
-                count = 0
-                while current_depth > count:
-                    update = await self.queue.get()
-                    count += 1
-                    if update == SHUTDOWN_SENTINEL:
-                        self.running = False
-                        break
-                    ret.append(update)
-
-                yield ret
-
-                for _ in range(count):
-                    self.queue.task_done()
+                    self.running = False
+                    break
+                ret.append(update)
+
+            yield ret
 
 
 class BackendCallback:
@@ -5,21 +5,53 @@ Please see the LICENSE file for the terms and conditions
 associated with this software.
 '''
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import asyncio
 import logging
-from typing import Optional, ByteString
+from typing import Optional
 
 from aiokafka import AIOKafkaProducer
 from aiokafka.errors import RequestTimedOutError, KafkaConnectionError, NodeNotReadyError
 from yapic import json
+try:
+    from aiokafka.codec import has_lz4
+except ImportError:
+    # aiokafka < 0.9.0 uses the codecs bundled with kafka-python
+    from kafka.codec import has_lz4
 
 from cryptofeed.backends.backend import BackendBookCallback, BackendCallback, BackendQueue
 
 LOG = logging.getLogger('feedhandler')
+# Started producers (as futures) and their reference counts, keyed on producer configuration
+_producers = {}
+_producer_refs = defaultdict(int)
+# Batch serialization shares a single worker thread, and small batches are cheaper to serialize inline
+_serializer_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='kafka-serializer')
+_executor_batch_size = 64
+
+
+def _config_key(config: dict) -> tuple:
+    # client_id only labels the connection, so it does not prevent callbacks from sharing a producer
+    return tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in config.items() if k != 'client_id'))
+
+
+def _discard_failed_startup(producer_key: tuple, startup: asyncio.Future):
+    # Drop a failed or cancelled startup so later callbacks with the same configuration start a new producer
+    if (startup.cancelled() or startup.exception() is not None) and _producers.get(producer_key) is startup:
+        del _producers[producer_key]
+
+
+def _passthrough(data):
+    return data
+
+
+def _serialize_batch(serialize, updates: list) -> list:
+    return [serialize(update) for update in updates]
 
 
 class KafkaCallback(BackendQueue):
-    def __init__(self, key=None, numeric_type=float, none_to=None, **kwargs):
+    def __init__(self, key=None, numeric_type=float, none_to=None, serialize_in_executor=False, **kwargs):
         """
         You can pass configuration options to AIOKafkaProducer as keyword arguments.
         (either individual kwargs, an unpacked dictionary `**config_dict`, or both)
@@ -37,76 +69,167 @@ class KafkaCallback(BackendQueue):
             'value_serializer': your_serialization_function}
             
         (Passing the event loop is already handled)
+
+        Unless overridden, the producer is configured for throughput rather than latency:
+        linger_ms=50, max_batch_size=65536, acks=1 and lz4 compression (when the lz4 library is installed)
+        acks=1 only waits for the partition leader, which suits market data that can be replayed. Use
+        acks='all' or enable_idempotence=True (which implies acks='all') when every message must reach
+        all in-sync replicas. Note that aiokafka has no max_in_flight_requests_per_connection option.
+
+        Callbacks created with identical configuration (ignoring client_id) share one AIOKafkaProducer,
+        so their messages are batched together over the same connections. The shared producer uses the
+        client_id of the first callback to connect.
+
+        serialize_in_executor: bool
+            serialize batches of updates in a worker thread (shared by all Kafka callbacks) rather than
+            on the event loop itself. Small batches are still serialized inline. Useful when the writer
+            shares its loop with busy feeds.
         """
+        kwargs.setdefault('linger_ms', 50)
+        kwargs.setdefault('max_batch_size', 65536)
+        if has_lz4():
+            kwargs.setdefault('compression_type', 'lz4')
+        if not kwargs.get('enable_idempotence'):
+            # idempotent producers require acks='all'
+            kwargs.setdefault('acks', 1)
         self.producer_config = kwargs
         self.producer = None
+        self._producer_key = None
         self.key: str = key or self.default_key
         self.numeric_type = numeric_type
         self.none_to = none_to
+        self.serialize_in_executor = serialize_in_executor
+        # A user-provided value_serializer is applied by AIOKafkaProducer, otherwise values are sent as JSON bytes
+        self._serialize_value = _passthrough if kwargs.get('value_serializer') else json.dumpb
+        # The message key is the same for every update, so encode it only once
+        self._message_key = self.key if kwargs.get('key_serializer') else self.key.encode()
         # Do not allow writer to send messages until connection confirmed
         self.running = False
     
-    def _default_serializer(self, to_bytes: dict | str) -> ByteString:
-        if isinstance(to_bytes, dict):
-            return json.dumpb(to_bytes)
-        elif isinstance(to_bytes, str):
-            return to_bytes.encode()
-        else:
-            raise TypeError(f'{type(to_bytes)} is not a valid Serialization type')
+    def _invalid_config(self, error: Exception):
+        LOG.error(f'{self.__class__.__name__}: Invalid AIOKafka configuration: {error.args}{chr(10)}See https://aiokafka.readthedocs.io/en/stable/api.html#aiokafka.AIOKafkaProducer for list of configuration options')
+        raise SystemExit
+
+    async def _start_producer(self) -> AIOKafkaProducer:
+        loop = asyncio.get_event_loop()
+        try:
+            config_keys = ', '.join([k for k in self.producer_config.keys()])
+            LOG.info(f'{self.__class__.__name__}: Configuring AIOKafka with the following parameters: {config_keys}')
+            producer = AIOKafkaProducer(**self.producer_config, loop=loop)
+        # Quit if invalid config option passed to AIOKafka
+        except (TypeError, ValueError) as e:
+            self._invalid_config(e)
+        while True:
+            try:
+                await producer.start()
+            except KafkaConnectionError:
+                LOG.error(f'{self.__class__.__name__}: Unable to bootstrap from host(s)')
+                await asyncio.sleep(10)
+            else:
+                LOG.info(f'{self.__class__.__name__}: "{producer.client._client_id}" connected to cluster containing {len(producer.client.cluster.brokers())} broker(s)')
+                return producer
 
     async def _connect(self):
         if not self.producer:
-            loop = asyncio.get_event_loop()
+            # Callbacks with identical configuration share a single producer (and its connections and batches)
+            producer_key = _config_key(self.producer_config)
             try:
-                config_keys = ', '.join([k for k in self.producer_config.keys()])
-                LOG.info(f'{self.__class__.__name__}: Configuring AIOKafka with the following parameters: {config_keys}')
-                self.producer = AIOKafkaProducer(**self.producer_config, loop=loop)
-            # Quit if invalid config option passed to AIOKafka
-            except (TypeError, ValueError) as e:
-                LOG.error(f'{self.__class__.__name__}: Invalid AIOKafka configuration: {e.args}{chr(10)}See https://aiokafka.readthedocs.io/en/stable/api.html#aiokafka.AIOKafkaProducer for list of configuration options')
-                raise SystemExit
-            else:
-                while not self.running:
-                    try:
-                        await self.producer.start()
-                    except KafkaConnectionError:
-                        LOG.error(f'{self.__class__.__name__}: Unable to bootstrap from host(s)')
-                        await asyncio.sleep(10)
-                    else:
-                        LOG.info(f'{self.__class__.__name__}: "{self.producer.client._client_id}" connected to cluster containing {len(self.producer.client.cluster.brokers())} broker(s)')
-                        self.running = True
-
+                hash(producer_key)
+            # Producers can only be shared if every configuration value is hashable (lists are converted)
+            except TypeError as e:
+                self._invalid_config(e)
+            startup = _producers.get(producer_key)
+            if startup is None:
+                startup = _producers[producer_key] = asyncio.ensure_future(self._start_producer())
+                startup.add_done_callback(partial(_discard_failed_startup, producer_key))
+            _producer_refs[producer_key] += 1
+            self._producer_key = producer_key
+            # shield so that cancelling one callback does not cancel the startup shared with the others
+            self.producer = await asyncio.shield(startup)
+            if self.producer_config.get('client_id', self.producer.client._client_id) != self.producer.client._client_id:
+                LOG.info(f'{self.__class__.__name__}: "{self.producer_config["client_id"]}" sharing producer "{self.producer.client._client_id}"')
+            self.running = True
+
+    async def _release_producer(self):
+        if self._producer_key is None:
+            return
+        producer_key, self._producer_key = self._producer_key, None
+        _producer_refs[producer_key] -= 1
+        # Only the last callback using a shared producer may stop it
+        if _producer_refs[producer_key] > 0:
+            return
+        del _producer_refs[producer_key]
+        startup = _producers.pop(producer_key, None)
+        if startup is None or startup.cancelled():
+            return
+        if not startup.done():
+            # nobody is waiting on the producer any more, so stop bootstrapping it
+            startup.cancel()
+            return
+        if startup.exception() is not None:
+            return
+        producer = startup.result()
+        LOG.info(f"{self.__class__.__name__}: sending last messages and closing connection '{producer.client._client_id}'")
+        await producer.stop()
 
     def topic(self, data: dict) -> str:
         return f"{self.key}-{data['exchange']}-{data['symbol']}"
 
     def partition_key(self, data: dict) -> Optional[bytes]:
+        """
+        Message key for this update. Returning None uses the callback's key instead.
+        If a key_serializer is configured, the return value is passed to it, so return
+        whatever type that serializer accepts (the callback's key is passed to it as a str).
+        """
         return None
 
     def partition(self, data: dict) -> Optional[int]:
         return None
 
+    def _log_send_error(self, error: Exception):
+        if isinstance(error, RequestTimedOutError):
+            LOG.error(f'{self.__class__.__name__}: No response received from server within {self.producer._request_timeout_ms} ms. Messages may not have been delivered')
+        elif isinstance(error, NodeNotReadyError):
+            LOG.error(f'{self.__class__.__name__}: Node not ready')
+        else:
+            LOG.info(f'{self.__class__.__name__}: Encountered an error:{chr(10)}{error}')
+
+    def _delivery_done(self, future: asyncio.Future):
+        if not future.cancelled() and future.exception():
+            self._log_send_error(future.exception())
+
     async def writer(self):
-        await self._connect()
-        while self.running:
-            async with self.read_queue() as updates:
-                for index in range(len(updates)):
-                    topic = self.topic(updates[index])
-                    # Check for user-provided serializers, otherwise use default
-                    value = updates[index] if self.producer_config.get('value_serializer') else self._default_serializer(updates[index])
-                    key = self.key if self.producer_config.get('key_serializer') else self._default_serializer(self.key)
-                    partition = self.partition(updates[index])
-                    try:
-                        send_future = await self.producer.send(topic, value, key, partition)
-                        await send_future
-                    except RequestTimedOutError:
-                        LOG.error(f'{self.__class__.__name__}: No response received from server within {self.producer._request_timeout_ms} ms. Messages may not have been delivered')
-                    except NodeNotReadyError:
-                        LOG.error(f'{self.__class__.__name__}: Node not ready')
-                    except Exception as e:
-                        LOG.info(f'{self.__class__.__name__}: Encountered an error:{chr(10)}{e}')
-        LOG.info(f"{self.__class__.__name__}: sending last messages and closing connection '{self.producer.client._client_id}'")
-        await self.producer.stop()
+        try:
+            await self._connect()
+            # Bind everything that is fixed for the lifetime of the writer outside of the per-message loop
+            send = self.producer.send
+            topic = self.topic
+            serialize = self._serialize_value
+            key = self._message_key
+            partition_key = self.partition_key
+            partition = self.partition
+            loop = asyncio.get_running_loop()
+            # a user value_serializer runs inside AIOKafkaProducer, so there is nothing to offload
+            offload = self.serialize_in_executor and serialize is not _passthrough
+            while self.running:
+                async with self.read_queue() as updates:
+                    if offload and len(updates) >= _executor_batch_size:
+                        values = await loop.run_in_executor(_serializer_pool, _serialize_batch, serialize, updates)
+                    else:
+                        values = map(serialize, updates)
+                    for update, value in zip(updates, values):
+                        try:
+                            # send() only waits when the producer's buffer is full, delivery is reported asynchronously
+                            message_key = partition_key(update)
+                            if message_key is None:
+                                message_key = key
+                            future = await send(topic(update), value, message_key, partition(update))
+                        except Exception as e:
+                            self._log_send_error(e)
+                        else:
+                            future.add_done_callback(self._delivery_done)
+        finally:
+            await self._release_producer()
 
 
 class TradeKafka(KafkaCallback, BackendCallback):
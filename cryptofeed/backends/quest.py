@@ -6,7 +6,7 @@ associated with this software.
 '''
 import logging
 
-from cryptofeed.backends.backend import BackendCallback
+from cryptofeed.backends.backend import BackendCallback, BackendQueue
 from cryptofeed.backends.socket import SocketCallback
 
 
@@ -34,7 +34,7 @@ class QuestCallback(SocketCallback):
         received_timestamp_int = int(data["receipt_timestamp"] * 1_000_000)
         timestamp_int = int(timestamp * 1_000_000_000) if timestamp is not None else received_timestamp_int * 1000
         update = f'{self.key}-{data["exchange"]},symbol={data["symbol"]} {d},receipt_timestamp={received_timestamp_int}t {timestamp_int}'
-        await self.queue.put(update)
+        await BackendQueue.write(self, update)
 
     def format(self, data):
         ret = []
@@ -57,7 +57,7 @@ class TradeQuest(QuestCallback, BackendCallback):
         timestamp_int = int(timestamp * 1_000_000_000) if timestamp is not None else received_timestamp_int * 1000
         update = f'{self.key}-{data["exchange"]},symbol={data["symbol"]},side={data["side"]},type={data["type"]} ' \
                  f'price={data["price"]},amount={data["amount"]},id={data["id"]}i,receipt_timestamp={received_timestamp_int}t {timestamp_int}'
-        await self.queue.put(update)
+        await BackendQueue.write(self, update)
 
 
 class FundingQuest(QuestCallback, BackendCallback):
@@ -77,7 +77,7 @@ class BookQuest(QuestCallback):
         receipt_timestamp_int = int(receipt_timestamp * 1_000_000)
         timestamp_int = int(timestamp * 1_000_000_000) if timestamp is not None else receipt_timestamp_int * 1000
         update = f'{self.key}-{book.exchange},symbol={book.symbol} {vals},receipt_timestamp={receipt_timestamp_int}t {timestamp_int}'
-        await self.queue.put(update)
+        await BackendQueue.write(self, update)
 
 
 class TickerQuest(QuestCallback, BackendCallback):
@@ -100,7 +100,7 @@ class CandlesQuest(QuestCallback, BackendCallback):
         timestamp_str = f',timestamp={int(timestamp * 1_000_000_000)}i' if timestamp is not None else ''
         trades = f',trades={data["trades"]},' if data['trades'] else ','
         update = f'{self.key}-{data["exchange"]},symbol={data["symbol"]},interval={data["interval"]} start={data["start"]},stop={data["stop"]}{trades}open={data["open"]},close={data["close"]},high={data["high"]},low={data["low"]},volume={data["volume"]}{timestamp_str},receipt_timestamp={int(data["receipt_timestamp"]) * 1_000_000}t {int(data["receipt_timestamp"] * 1_000_000_000)}'
-        await self.queue.put(update)
+        await BackendQueue.write(self, update)
 
 
 class OrderInfoQuest(QuestCallback, BackendCallback):
@@ -44,13 +44,15 @@ class RedisZSetCallback(RedisCallback):
 
     async def writer(self):
         conn = aioredis.from_url(self.redis)
+        # Pipeline.execute() always resets the pipeline (clearing queued commands and releasing its
+        # connection), which is what allows a single pipeline to be reused for every batch
+        pipe = conn.pipeline(transaction=False)
 
         while self.running:
             async with self.read_queue() as updates:
-                async with conn.pipeline(transaction=False) as pipe:
-                    for update in updates:
-                        pipe = pipe.zadd(f"{self.key}-{update['exchange']}-{update['symbol']}", {json.dumps(update): update[self.score_key]}, nx=True)
-                    await pipe.execute()
+                for update in updates:
+                    pipe.zadd(f"{self.key}-{update['exchange']}-{update['symbol']}", {json.dumpb(update): update[self.score_key]}, nx=True)
+                await pipe.execute()
 
         await conn.close()
         await conn.connection_pool.disconnect()
@@ -59,20 +61,21 @@ class RedisZSetCallback(RedisCallback):
 class RedisStreamCallback(RedisCallback):
     async def writer(self):
         conn = aioredis.from_url(self.redis)
+        # reused across batches, see RedisZSetCallback.writer
+        pipe = conn.pipeline(transaction=False)
 
         while self.running:
             async with self.read_queue() as updates:
-                async with conn.pipeline(transaction=False) as pipe:
-                    for update in updates:
-                        if 'delta' in update:
-                            update['delta'] = json.dumps(update['delta'])
-                        elif 'book' in update:
-                            update['book'] = json.dumps(update['book'])
-                        elif 'closed' in update:
-                            update['closed'] = str(update['closed'])
-
-                        pipe = pipe.xadd(f"{self.key}-{update['exchange']}-{update['symbol']}", update)
-                    await pipe.execute()
+                for update in updates:
+                    if 'delta' in update:
+                        update['delta'] = json.dumpb(update['delta'])
+                    elif 'book' in update:
+                        update['book'] = json.dumpb(update['book'])
+                    elif 'closed' in update:
+                        update['closed'] = str(update['closed'])
+
+                    pipe.xadd(f"{self.key}-{update['exchange']}-{update['symbol']}", update)
+                await pipe.execute()
 
         await conn.close()
         await conn.connection_pool.disconnect()
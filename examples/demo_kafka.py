@@ -6,8 +6,8 @@ associated with this software.
 '''
 from typing import Optional
 from cryptofeed import FeedHandler
-from cryptofeed.backends.kafka import BookKafka, TradeKafka
-from cryptofeed.defines import L2_BOOK, TRADES
+from cryptofeed.backends.kafka import BookKafka, TickerKafka, TradeKafka
+from cryptofeed.defines import L2_BOOK, TICKER, TRADES
 from cryptofeed.exchanges import Coinbase
 
 
@@ -20,29 +20,56 @@ https://aiokafka.readthedocs.io/en/stable/api.html#aiokafka.AIOKafkaProducer
 You can run a Kafka consumer in the console with the following command
 (assuminng the defaults for the consumer group and bootstrap server)
 
-$ kafka-console-consumer --bootstrap-server 127.0.0.1:9092 --topic trades-COINBASE-BTC-USD
+$ kafka-console-consumer --bootstrap-server 127.0.0.1:9092 --topic trades-COINBASE
+
+Topics are created on first use if the broker allows it. Creating them beforehand avoids the
+extra metadata requests (and latency) on the first messages, e.g.
+
+$ kafka-topics --bootstrap-server 127.0.0.1:9092 --create --topic trades-COINBASE --partitions 4
 """
 
 
 class CustomTradeKafka(TradeKafka):
+    # All symbols share one topic and are keyed by symbol, so Kafka spreads them across partitions.
+    # Create the topic with at least as many partitions as symbols to let consumers scale out.
     def topic(self, data: dict) -> str:
         return f"{self.key}-{data['exchange']}"
 
     def partition_key(self, data: dict) -> Optional[bytes]:
-        return f"{data['symbol']}".encode('utf-8')
+        return data['symbol'].encode()
+
+
+COMMON_KAFKA_CONFIG = {
+    'bootstrap_servers': '127.0.0.1:9092',
+    'acks': 1,
+    'request_timeout_ms': 30000,
+    # Keep idle connections for low rate channels open rather than reconnecting (broker default is 9 minutes)
+    'connections_max_idle_ms': 540000,
+    # Let aiokafka coalesce many updates into each produce request (max_batch_size must not exceed max_request_size)
+    'linger_ms': 50,
+    'max_batch_size': 262144,
+    'max_request_size': 1048576,
+    # Book updates are highly repetitive and compress well (requires `pip install lz4`)
+    'compression_type': 'lz4',
+    # The topic set is fixed, so cluster metadata does not need refreshing as often
+    'metadata_max_age_ms': 600000,
+}
+# Tickers are periodic snapshots - a lost message is superseded by the next one, so skip broker acks
+FIRE_AND_FORGET_CONFIG = dict(COMMON_KAFKA_CONFIG, acks=0, max_batch_size=524288)
+# Trades must not be duplicated when the producer retries, so use an idempotent producer (requires acks='all')
+IDEMPOTENT_CONFIG = dict(COMMON_KAFKA_CONFIG, acks='all', enable_idempotence=True)
 
 
 def main():
-    common_kafka_config = {
-        'bootstrap_servers': '127.0.0.1:9092',
-        'acks': 1,
-        'request_timeout_ms': 10000,
-        'connections_max_idle_ms': 20000,
+    f = FeedHandler({'log': {'filename': 'feedhandler.log', 'level': 'INFO'}})
+    cbs = {
+        TRADES: CustomTradeKafka(client_id='Coinbase Trades', **IDEMPOTENT_CONFIG),
+        # BookKafka publishes book deltas, with a full snapshot every `snapshot_interval` deltas so consumers can resync
+        L2_BOOK: BookKafka(client_id='Coinbase Book', snapshot_interval=1000, **COMMON_KAFKA_CONFIG),
+        TICKER: TickerKafka(client_id='Coinbase Ticker', **FIRE_AND_FORGET_CONFIG)
     }
-    f = FeedHandler({'log':{'filename': 'feedhandler.log', 'level': 'INFO'}})
-    cbs = {TRADES: CustomTradeKafka(client_id='Coinbase Trades', **common_kafka_config), L2_BOOK: BookKafka(client_id='Coinbase Book', **common_kafka_config)}
 
-    f.add_feed(Coinbase(max_depth=10, channels=[TRADES, L2_BOOK], symbols=['BTC-USD'], callbacks=cbs))
+    f.add_feed(Coinbase(max_depth=10, channels=[TRADES, L2_BOOK, TICKER], symbols=['BTC-USD'], callbacks=cbs))
 
     f.run()
 
@@ -0,0 +1,81 @@
+'''
+Copyright (C) 2017-2022 Bryant Moscon - bmoscon@gmail.com
+
+Please see the LICENSE file for the terms and conditions
+associated with this software.
+'''
+import asyncio
+
+from cryptofeed.backends.backend import BackendQueue, SHUTDOWN_SENTINEL
+
+
+class RecordingBackend(BackendQueue):
+    def __init__(self):
+        self.running = True
+        self.batches = []
+
+    async def writer(self):
+        while self.running:
+            async with self.read_queue() as updates:
+                self.batches.append(updates)
+
+
+def test_write_wakes_waiting_writer():
+    async def run():
+        backend = RecordingBackend()
+        backend.start(asyncio.get_running_loop())
+        await asyncio.sleep(0)
+        assert backend._waiter is not None
+
+        await backend.write({'a': 1})
+        await asyncio.sleep(0)
+        assert backend.batches == [[{'a': 1}]]
+
+        await backend.stop()
+        await backend.worker
+
+    asyncio.run(run())
+
+
+def test_pending_updates_drained_as_one_batch():
+    async def run():
+        backend = RecordingBackend()
+        backend.start(asyncio.get_running_loop())
+        for i in range(5):
+            await backend.write(i)
+        await asyncio.sleep(0)
+        assert backend.batches == [[0, 1, 2, 3, 4]]
+
+        await backend.stop()
+        await backend.worker
+
+    asyncio.run(run())
+
+
+def test_stop_on_empty_queue():
+    async def run():
+        backend = RecordingBackend()
+        backend.start(asyncio.get_running_loop())
+        await asyncio.sleep(0)
+
+        await backend.stop()
+        await asyncio.wait_for(backend.worker, 1)
+        assert backend.batches == [[]]
+        assert backend.running is False
+
+    asyncio.run(run())
+
+
+def test_shutdown_sentinel_clears_running():
+    async def run():
+        backend = RecordingBackend()
+        backend.start(asyncio.get_running_loop())
+        await asyncio.sleep(0)
+
+        # enqueue the sentinel without stop() so running can only be cleared by read_queue
+        await backend.write(SHUTDOWN_SENTINEL)
+        await asyncio.wait_for(backend.worker, 1)
+        assert backend.batches == [[]]
+        assert backend.running is False
+
+    asyncio.run(run())
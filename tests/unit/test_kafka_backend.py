@@ -0,0 +1,228 @@
+'''
+Copyright (C) 2017-2022 Bryant Moscon - bmoscon@gmail.com
+
+Please see the LICENSE file for the terms and conditions
+associated with this software.
+'''
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+from yapic import json
+
+kafka = pytest.importorskip('cryptofeed.backends.kafka')
+
+
+class FakeProducer:
+    instances = []
+    gate = None
+
+    def __init__(self, loop=None, **config):
+        self.config = config
+        self.client = SimpleNamespace(_client_id=config.get('client_id', 'aiokafka'), cluster=SimpleNamespace(brokers=lambda: [0]))
+        self.sent = []
+        self.stopped = False
+        FakeProducer.instances.append(self)
+
+    async def start(self):
+        await FakeProducer.gate.wait()
+
+    async def stop(self):
+        self.stopped = True
+
+    async def send(self, topic, value, key, partition):
+        self.sent.append((topic, value, key, partition))
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        return future
+
+
+class RecordingExecutor(ThreadPoolExecutor):
+    def __init__(self):
+        super().__init__(max_workers=1)
+        self.submitted = 0
+
+    def submit(self, *args, **kwargs):
+        self.submitted += 1
+        return super().submit(*args, **kwargs)
+
+
+class KeyedTradeKafka(kafka.TradeKafka):
+    keys = {'BTC-USD': b'BTC-USD', 'ETH-USD': None, 'SOL-USD': b''}
+
+    def partition_key(self, data: dict):
+        return self.keys[data['symbol']]
+
+
+@pytest.fixture(autouse=True)
+def fake_producer(monkeypatch):
+    FakeProducer.instances = []
+    monkeypatch.setattr(kafka, 'AIOKafkaProducer', FakeProducer)
+    yield
+    assert not kafka._producers
+    assert not kafka._producer_refs
+
+
+def update(**kwargs):
+    return {'exchange': 'COINBASE', 'symbol': 'BTC-USD', **kwargs}
+
+
+async def connected(*callbacks):
+    loop = asyncio.get_running_loop()
+    for callback in callbacks:
+        callback.start(loop)
+    FakeProducer.gate.set()
+    while not all(callback.running for callback in callbacks):
+        await asyncio.sleep(0)
+
+
+async def shutdown(*callbacks):
+    for callback in callbacks:
+        await callback.stop()
+        await asyncio.wait_for(callback.worker, 1)
+
+
+def run(test):
+    async def wrapper():
+        FakeProducer.gate = asyncio.Event()
+        await test()
+    asyncio.run(wrapper())
+
+
+def test_same_config_shares_producer():
+    async def test():
+        a = kafka.TradeKafka(bootstrap_servers='127.0.0.1:9092')
+        b = kafka.BookKafka(bootstrap_servers='127.0.0.1:9092')
+        await connected(a, b)
+        assert a.producer is b.producer
+        assert len(FakeProducer.instances) == 1
+        await shutdown(a, b)
+    run(test)
+
+
+def test_producer_stopped_by_last_writer():
+    async def test():
+        a = kafka.TradeKafka(bootstrap_servers='127.0.0.1:9092')
+        b = kafka.TickerKafka(bootstrap_servers='127.0.0.1:9092')
+        await connected(a, b)
+        producer = a.producer
+
+        await shutdown(a)
+        assert not producer.stopped
+        await shutdown(b)
+        assert producer.stopped
+    run(test)
+
+
+def test_cancelled_writer_does_not_cancel_shared_startup():
+    async def test():
+        loop = asyncio.get_running_loop()
+        a = kafka.TradeKafka(bootstrap_servers='127.0.0.1:9092')
+        b = kafka.TickerKafka(bootstrap_servers='127.0.0.1:9092')
+        a.start(loop)
+        b.start(loop)
+        await asyncio.sleep(0)
+
+        a.worker.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await a.worker
+        FakeProducer.gate.set()
+        while not b.running:
+            await asyncio.sleep(0)
+        assert not b.worker.done()
+        assert len(FakeProducer.instances) == 1
+
+        await shutdown(b)
+        assert b.producer.stopped
+    run(test)
+
+
+def test_last_writer_leaving_cancels_startup():
+    async def test():
+        a = kafka.TradeKafka(bootstrap_servers='127.0.0.1:9092')
+        a.start(asyncio.get_running_loop())
+        await asyncio.sleep(0)
+        startup, = kafka._producers.values()
+        a.worker.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await a.worker
+        await asyncio.sleep(0)
+        assert startup.cancelled()
+        assert not kafka._producers
+
+        b = kafka.TradeKafka(bootstrap_servers='127.0.0.1:9092')
+        await connected(b)
+        assert len(FakeProducer.instances) == 2
+        assert b.producer is FakeProducer.instances[1]
+        await shutdown(b)
+    run(test)
+
+
+def test_client_id_does_not_prevent_sharing():
+    async def test():
+        a = kafka.TradeKafka(bootstrap_servers='127.0.0.1:9092', client_id='trades')
+        b = kafka.BookKafka(bootstrap_servers='127.0.0.1:9092', client_id='book')
+        await connected(a, b)
+        assert a.producer is b.producer
+        await shutdown(a, b)
+    run(test)
+
+
+def test_different_config_does_not_share():
+    async def test():
+        a = kafka.TradeKafka(bootstrap_servers='127.0.0.1:9092', acks=1)
+        b = kafka.TickerKafka(bootstrap_servers='127.0.0.1:9092', acks=0)
+        await connected(a, b)
+        assert a.producer is not b.producer
+        await shutdown(a, b)
+    run(test)
+
+
+def test_unhashable_config_is_reported():
+    async def test():
+        callback = kafka.TradeKafka(bootstrap_servers='127.0.0.1:9092', ssl_context={})
+        await callback._connect()
+
+    with pytest.raises(SystemExit):
+        run(test)
+
+
+def test_partition_key_used_as_message_key():
+    async def test():
+        callback = KeyedTradeKafka(bootstrap_servers='127.0.0.1:9092')
+        await connected(callback)
+        for symbol in ('BTC-USD', 'ETH-USD', 'SOL-USD'):
+            await callback.write(update(symbol=symbol))
+        await shutdown(callback)
+        assert [key for _, _, key, _ in callback.producer.sent] == [b'BTC-USD', b'trades', b'']
+    run(test)
+
+
+def test_serialize_in_executor_batch_rules(monkeypatch):
+    pool = RecordingExecutor()
+    monkeypatch.setattr(kafka, '_serializer_pool', pool)
+
+    async def send_batch(size, **kwargs):
+        callback = kafka.TradeKafka(bootstrap_servers='127.0.0.1:9092', **kwargs)
+        await connected(callback)
+        for i in range(size):
+            await callback.write(update(id=i))
+        await shutdown(callback)
+        return [value for _, value, _, _ in callback.producer.sent]
+
+    async def test():
+        await send_batch(kafka._executor_batch_size - 1, serialize_in_executor=True)
+        assert pool.submitted == 0
+
+        await send_batch(kafka._executor_batch_size, serialize_in_executor=True, value_serializer=json.dumpb)
+        assert pool.submitted == 0
+
+        offloaded = await send_batch(kafka._executor_batch_size, serialize_in_executor=True)
+        assert pool.submitted == 1
+        inline = await send_batch(kafka._executor_batch_size)
+        assert pool.submitted == 1
+        assert offloaded == inline == [json.dumpb(update(id=i)) for i in range(kafka._executor_batch_size)]
+
+    run(test)
+    pool.shutdown()